@@ -1,9 +1,11 @@
 import os
 import logging
-from telegram import Bot
+from telegram import Bot, InputMediaPhoto
 from telegram.error import TelegramError, RetryAfter
 import asyncio
 from parser import AtolinParser
+from tracing import tracer
+from scheduler import CadenceScheduler
 import json
 from datetime import datetime
 import re
@@ -13,77 +15,93 @@ logger = logging.getLogger(__name__)
 
 class ProfileBot:
     def __init__(self, token, channel_id):
-        self.bot = Bot(token=token)
+        # TG_API_BASE_URL allows pointing the bot at a local or fake Bot API server.
+        # The token is appended to it as is, so the value must end with "/bot", e.g. http://localhost:8081/bot
+        base_url = os.getenv('TG_API_BASE_URL')
+        if base_url:
+            self.bot = Bot(token=token, base_url=base_url)
+            logger.info(f"Using Bot API base url: {base_url}")
+        else:
+            self.bot = Bot(token=token)
         self.channel_id = channel_id
         self.parser = AtolinParser()
         self.default_delay = 10  # Default delay between messages in seconds
+        
+        # Group qualifying profiles into albums of up to ALBUM_SIZE photos (Telegram allows 2-10), 1 disables
+        try:
+            self.album_size = min(int(os.getenv('ALBUM_SIZE', '1')), 10)
+        except ValueError:
+            logger.warning(f"Invalid ALBUM_SIZE: {os.getenv('ALBUM_SIZE')}, sending profiles one by one")
+            self.album_size = 1
 
     def escape_markdown(self, text: str) -> str:
         """Escape special characters for MarkdownV2"""
         need_escape = r'_*[]()~`>#+-=|{}.!'
         return ''.join(f'\\{c}' if c in need_escape else c for c in str(text))
 
-    async def send_profile(self, profile_data):
+    def format_caption(self, profile_data):
+        message_parts = []
+        
+        # Combine all basic info into one line
+        first_line = self.escape_markdown(profile_data['name_location'])
+        if 'data' in profile_data and profile_data['data']:
+            params = []
+            if 'height' in profile_data['data']:
+                params.append(self.escape_markdown(profile_data['data']['height']))
+            if 'weight' in profile_data['data']:
+                params.append(self.escape_markdown(profile_data['data']['weight']))
+            if params:
+                first_line += f", {', '.join(params)}"
+        
+        # Make first line a link
+        was_prefix = "была " if profile_data['status'].lower() != "на сайте" else ""
+        status_text = f"{was_prefix}{self.escape_markdown(profile_data['status'])}"
+        message_parts.append(f"Новая анкета: 👤 [{first_line}]({profile_data['profile_url']}) \\({status_text}\\)")
+        
+        # Goals
+        if 'goals' in profile_data and profile_data['goals']:
+            goals = [self.escape_markdown(goal) for goal in profile_data['goals']]
+            message_parts.append(f"🎯 {', '.join(goals)}")
+        
+        # About
+        if 'about' in profile_data:
+            message_parts.append(f"💬 {self.escape_markdown(profile_data['about'])}")
+        
+        # Additional photos info
+        if profile_data['additional_photos']:
+            message_parts.append(f"📸 {self.escape_markdown(profile_data['additional_photos'])}")
+
+        # Score info
+        if 'score' in profile_data:
+            message_parts.append(f"⭐️ Antifroud score: {self.escape_markdown(str(profile_data['score']))}")
+
+        message_parts.append(f"\n")
+        
+        # Join with single line breaks
+        return "\n".join(message_parts)
+
+    async def send_with_retries(self, send, profiles):
+        """Call send() handling flood control and timeouts.
+
+        Returns True when sent, False when retries ran out and None on a non-retryable error.
+        """
+        ids = ', '.join(str(p['id']) for p in profiles)
         max_retries = 3
         current_retry = 0
         
         while current_retry < max_retries:
             try:
-                message_parts = []
-                
-                # Combine all basic info into one line
-                first_line = self.escape_markdown(profile_data['name_location'])
-                if 'data' in profile_data and profile_data['data']:
-                    params = []
-                    if 'height' in profile_data['data']:
-                        params.append(self.escape_markdown(profile_data['data']['height']))
-                    if 'weight' in profile_data['data']:
-                        params.append(self.escape_markdown(profile_data['data']['weight']))
-                    if params:
-                        first_line += f", {', '.join(params)}"
-                
-                # Make first line a link
-                was_prefix = "была " if profile_data['status'].lower() != "на сайте" else ""
-                status_text = f"{was_prefix}{self.escape_markdown(profile_data['status'])}"
-                message_parts.append(f"Новая анкета: 👤 [{first_line}]({profile_data['profile_url']}) \\({status_text}\\)")
-                
-                # Goals
-                if 'goals' in profile_data and profile_data['goals']:
-                    goals = [self.escape_markdown(goal) for goal in profile_data['goals']]
-                    message_parts.append(f"🎯 {', '.join(goals)}")
-                
-                # About
-                if 'about' in profile_data:
-                    message_parts.append(f"💬 {self.escape_markdown(profile_data['about'])}")
-                
-                # Additional photos info
-                if profile_data['additional_photos']:
-                    message_parts.append(f"📸 {self.escape_markdown(profile_data['additional_photos'])}")
-
-                # Score info
-                if 'score' in profile_data:
-                    message_parts.append(f"⭐️ Antifroud score: {self.escape_markdown(str(profile_data['score']))}")
-
-                message_parts.append(f"\n")
-                
-                # Join with single line breaks
-                message = "\n".join(message_parts)
-                
-                # Send photo with caption
-                await self.bot.send_photo(
-                    chat_id=self.channel_id,
-                    photo=profile_data['photo_url'],
-                    caption=message,
-                    parse_mode='MarkdownV2'
-                )
-                logger.info(f"Sent profile {profile_data['id']} to channel")
-                await asyncio.sleep(self.default_delay)  
-                return
+                with tracer.span("send", profiles=ids):
+                    await send()
+                with tracer.span("sleep", reason="send"):
+                    await asyncio.sleep(self.default_delay)  
+                return True
                 
             except RetryAfter as e:
                 retry_after = int(e.retry_after)
                 logger.warning(f"Flood control exceeded. Waiting {retry_after} seconds")
-                await asyncio.sleep(retry_after)
+                with tracer.span("sleep", reason="flood"):
+                    await asyncio.sleep(retry_after)
                 current_retry += 1
                 
             except TelegramError as e:
@@ -93,19 +111,64 @@ class ProfileBot:
                     retry_match = re.search(r'Retry in (\d+) seconds', error_msg)
                     retry_after = int(retry_match.group(1)) if retry_match else self.default_delay
                     logger.warning(f"Flood control exceeded. Waiting {retry_after} seconds")
-                    await asyncio.sleep(retry_after)
+                    with tracer.span("sleep", reason="flood"):
+                        await asyncio.sleep(retry_after)
                     current_retry += 1
                 else:
-                    logger.error(f"Failed to send profile {profile_data['id']}: {str(e)}")
+                    logger.error(f"Failed to send profile(s) {ids}: {str(e)}")
                     if "Timed out" in error_msg:
                         await asyncio.sleep(self.default_delay)  # Wait default delay on timeout
                         current_retry += 1
                     else:
-                        break  # Break on other errors
+                        return None  # Give up on other errors
 
         if current_retry >= max_retries:
-            logger.error(f"Failed to send profile {profile_data['id']} after {max_retries} retries")
+            logger.error(f"Failed to send profile(s) {ids} after {max_retries} retries")
+        return False
+
+    async def send_profile(self, profile_data):
+        async def send():
+            # Send photo with caption
+            await self.bot.send_photo(
+                chat_id=self.channel_id,
+                photo=profile_data['photo_url'],
+                caption=self.format_caption(profile_data),
+                parse_mode='MarkdownV2'
+            )
+            logger.info(f"Sent profile {profile_data['id']} to channel")
+
+        return await self.send_with_retries(send, [profile_data])
+
+    async def send_album(self, profiles):
+        """Send several profiles as one media group, one caption per photo"""
+        if len(profiles) == 1:
+            return await self.send_profile(profiles[0])
 
+        async def send():
+            media = [
+                InputMediaPhoto(
+                    media=profile_data['photo_url'],
+                    caption=self.format_caption(profile_data),
+                    parse_mode='MarkdownV2'
+                )
+                for profile_data in profiles
+            ]
+            await self.bot.send_media_group(chat_id=self.channel_id, media=media)
+            logger.info(f"Sent album of {len(profiles)} profiles to channel")
+
+        result = await self.send_with_retries(send, profiles)
+        if result is None:
+            # One bad caption or photo url fails the whole group, send one by one to lose only that profile
+            logger.warning(f"Album of {len(profiles)} profiles rejected, sending them one by one")
+            for profile_data in profiles:
+                await self.send_profile(profile_data)
+        return result
+
+    def log_sent(self, profiles):
+        for profile_data in profiles:
+            logger.info(f"Sent profile {profile_data['id']} with score {profile_data.get('score', 0)}")
+
+    @tracer.traced("cycle", "location")
     async def process_new_profiles(self, end_page, age_from, age_to, location):
         logger.info("Starting profile collection")
         
@@ -135,13 +198,25 @@ class ProfileBot:
         
         if not is_first_run:
             # Send only profiles with score >= min_score_threshold
+            album = []
             for profile_id, profile_data in self.parser.new_profiles.items():
                 if profile_data.get('score', 0) >= self.parser.min_score_threshold:
+                    if self.album_size > 1:
+                        album.append(profile_data)
+                        if len(album) >= self.album_size:
+                            await self.send_album(album)
+                            self.log_sent(album)
+                            album = []
+                        continue
                     await self.send_profile(profile_data)
                     logger.info(f"Sent profile {profile_id} with score {profile_data.get('score', 0)}")
                 else:
                     logger.info(f"Profile {profile_id} has low score ({profile_data.get('score', 0)}), skipping")
             
+            if album:
+                await self.send_album(album)
+                self.log_sent(album)
+            
             # Clear new_profiles after processing
             self.parser.new_profiles = {}
 
@@ -162,6 +237,7 @@ async def run_periodic_check():
         location = os.getenv('SEARCH_LOCATION')
         check_interval = int(os.getenv('CHECK_INTERVAL', '3600'))  # Default 1 hour
         retry_interval = int(os.getenv('RETRY_INTERVAL', '300'))   # Default 5 minutes
+        adaptive_schedule = os.getenv('ADAPTIVE_SCHEDULE', '').lower() in ('1', 'true', 'yes')
         
         logger.info(f"Search parameters: pages 1-{end_page}, age {age_from}-{age_to}, location {location}")
         logger.info(f"Intervals: check {check_interval}s, retry {retry_interval}s")
@@ -176,23 +252,45 @@ async def run_periodic_check():
         
     bot = ProfileBot(token, channel_id)
     
+    scheduler = None
+    if adaptive_schedule and location in bot.parser.LOCATIONS:
+        scheduler = CadenceScheduler.from_env(
+            targets={location: bot.parser.LOCATIONS[location]},
+            base_interval=check_interval,
+            max_pages=end_page
+        )
+    
     while True:
         try:
-            current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            pages = end_page
+            if scheduler:
+                location, pages, wait = scheduler.next_run()
+                if wait > 0:
+                    logger.info(f"Waiting for {wait:.0f} seconds before next check")
+                    await asyncio.sleep(wait)
+            
+            started = datetime.now()
+            current_time = started.strftime("%Y-%m-%d %H:%M:%S")
             logger.info(f"Starting periodic check at {current_time}")
             
             await bot.process_new_profiles(
-                end_page=end_page,
+                end_page=pages,
                 age_from=age_from,
                 age_to=age_to,
                 location=location
             )
+            tracer.finish_cycle()
+            
+            if scheduler:
+                scheduler.record_cycle(location, started, pages, bot.parser.last_new_page, bot.parser.last_new_count)
+                continue
             
             logger.info(f"Waiting for {check_interval} seconds before next check")
             await asyncio.sleep(check_interval)
             
         except Exception as e:
             logger.error(f"Error during periodic check: {str(e)}")
+            tracer.finish_cycle()
             logger.info(f"Retrying in {retry_interval} seconds")
             await asyncio.sleep(retry_interval)
 
@@ -11,6 +11,7 @@ from typing import Dict, Optional
 from datetime import datetime
 import urllib3
 from fake_headers import Headers
+from tracing import tracer
 
 # Disable SSL warning
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -158,6 +159,8 @@ class AtolinParser:
         self.domain = "https://atolin.ru"
         self.profiles = {}
         self.new_profiles = {}
+        self.last_new_page = 0  # Deepest search page with new profiles in the last collection
+        self.last_new_count = 0
         
         # Load score settings from env
         self.min_score_threshold = float(os.getenv('MIN_SCORE_THRESHOLD', '2.0'))
@@ -205,6 +208,7 @@ class AtolinParser:
         os.makedirs('data', exist_ok=True)
         self.load_existing_profiles()
 
+    @tracer.traced("request", "url")
     def make_request(self, url: str, timeout: int = 10, max_retries: int = 3) -> Optional[requests.Response]:
         """Make HTTP request with proxy support and error handling"""
         for attempt in range(max_retries):
@@ -226,7 +230,7 @@ class AtolinParser:
                         logger.info(f"Profile {profile_id} returned 404, removing from database")
                         del self.profiles[profile_id]
                         # Save profiles after deletion
-                        with open('data/profiles.json', 'w', encoding='utf-8') as f:
+                        with tracer.span("save"), open('data/profiles.json', 'w', encoding='utf-8') as f:
                             json.dump(self.profiles, f, ensure_ascii=False, indent=2)
                     return None
                 response.raise_for_status()
@@ -235,7 +239,8 @@ class AtolinParser:
                 if attempt < max_retries - 1:
                     retry_delay = random.uniform(self.request_delay_min * 2, self.request_delay_max * 2)
                     logger.warning(f"Request failed for {url} (attempt {attempt + 1}/{max_retries}): {str(e)}. Retrying in {retry_delay:.1f} seconds...")
-                    time.sleep(retry_delay)
+                    with tracer.span("sleep", reason="retry"):
+                        time.sleep(retry_delay)
                 else:
                     logger.error(f"Request failed for {url} after {max_retries} attempts: {str(e)}")
                     # If this was a 404 error on the last attempt, handle profile deletion
@@ -245,7 +250,7 @@ class AtolinParser:
                             logger.info(f"Profile {profile_id} returned 404, removing from database")
                             del self.profiles[profile_id]
                             # Save profiles after deletion
-                            with open('data/profiles.json', 'w', encoding='utf-8') as f:
+                            with tracer.span("save"), open('data/profiles.json', 'w', encoding='utf-8') as f:
                                 json.dump(self.profiles, f, ensure_ascii=False, indent=2)
         return None
 
@@ -264,6 +269,7 @@ class AtolinParser:
             logger.error(f"Failed to load existing profiles: {str(e)}")
             self.profiles = {}
 
+    @tracer.traced("page", "page", "location_id")
     def get_search_page(self, age_from, age_to, location_id, page, gender=0):
         params = {
             "AnketaSearch[gender][]": gender,
@@ -315,17 +321,20 @@ class AtolinParser:
             
         return round(score, 2)  # Round to 2 decimal places for cleaner display
 
+    @tracer.traced("profile", "profile_url")
     def get_profile_details(self, profile_url: str) -> Optional[dict]:
         try:
             delay = random.uniform(self.request_delay_min, self.request_delay_max)
             logger.info(f"Waiting {delay:.2f} seconds before requesting profile details")
-            time.sleep(delay)
+            with tracer.span("sleep", reason="profile"):
+                time.sleep(delay)
             
             response = self.make_request(profile_url)
             if not response:
                 return None
             
-            soup = BeautifulSoup(response.text, 'html.parser')
+            with tracer.span("parse", url=profile_url):
+                soup = BeautifulSoup(response.text, 'html.parser')
             details = {}
             
             # Find details section
@@ -382,7 +391,8 @@ class AtolinParser:
             return None
             
         try:
-            soup = BeautifulSoup(html_content, 'html.parser')
+            with tracer.span("parse", target="search"):
+                soup = BeautifulSoup(html_content, 'html.parser')
             results = soup.select_one("#results")
             if results:
                 for item in results.find_all("div", recursive=False):
@@ -430,7 +440,8 @@ class AtolinParser:
                                 profile_data.update(details)
                                 
                             # Calculate and add score
-                            profile_data["score"] = self.calculate_profile_score(profile_data)
+                            with tracer.span("score", profile=profile_id):
+                                profile_data["score"] = self.calculate_profile_score(profile_data)
                             
                             # Add to new profiles and all profiles
                             self.new_profiles[profile_id] = profile_data
@@ -468,7 +479,8 @@ class AtolinParser:
                     self.profiles[profile_id].update(updated_profile)
                     
                     # Recalculate score
-                    new_score = self.calculate_profile_score(self.profiles[profile_id])
+                    with tracer.span("score", profile=profile_id):
+                        new_score = self.calculate_profile_score(self.profiles[profile_id])
                     self.profiles[profile_id]['score'] = new_score
                     
                     logger.info(f"Updated profile {profile_id}, new score: {new_score}")
@@ -477,13 +489,15 @@ class AtolinParser:
             except Exception as e:
                 logger.error(f"Failed to recheck profile {profile_id}: {str(e)}")
             
-            time.sleep(random.uniform(self.request_delay_min, self.request_delay_max))
+            with tracer.span("sleep", reason="recheck"):
+                time.sleep(random.uniform(self.request_delay_min, self.request_delay_max))
 
     def collect_profiles(self, end_page, age_from, age_to, location_id):
         logger.info(f"Starting collection from page 1 to {end_page}")
         
         # Clear new profiles at the start of collection
         self.new_profiles = {}
+        self.last_new_page = 0
         
         # First recheck existing low-score profiles
         self.recheck_low_score_profiles()
@@ -494,18 +508,24 @@ class AtolinParser:
             content = self.get_search_page(gender=0, age_from=age_from, age_to=age_to, location_id=location_id, page=page)
             
             if content:
+                new_before = len(self.new_profiles)
                 self.get_results_container(content)
+                if len(self.new_profiles) > new_before:
+                    self.last_new_page = page
                 
                 # Random delay between requests to avoid blocking
                 delay = random.uniform(self.request_delay_min, self.request_delay_max)
                 logger.info(f"Waiting {delay:.2f} seconds before next request")
-                time.sleep(delay)
+                with tracer.span("sleep", reason="page"):
+                    time.sleep(delay)
             else:
                 logger.error(f"Failed to get content for page {page}")
+        
+        self.last_new_count = len(self.new_profiles)
             
         # Save all profiles to profiles.json
         if self.profiles:
-            with open('data/profiles.json', 'w', encoding='utf-8') as f:
+            with tracer.span("save"), open('data/profiles.json', 'w', encoding='utf-8') as f:
                 json.dump(self.profiles, f, ensure_ascii=False, indent=2)
             logger.info(f"Saved {len(self.profiles)} total profiles to data/profiles.json")
         else:
@@ -0,0 +1,201 @@
+import os
+import json
+import math
+import time
+import logging
+from collections import deque
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+class CadenceScheduler:
+    """Spreads a daily page budget over targets and hours by observed new-profile arrival rate"""
+
+    def __init__(self, targets, base_interval, max_pages, min_interval=600, max_interval=14400,
+                 page_budget=None, history_days=14):
+        # targets: {location name: location id}
+        self.targets = targets
+        self.max_pages = max_pages
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.history_days = history_days
+        # Default budget is what the fixed schedule spends: every target at full depth each base_interval.
+        # Only search pages are counted, low-score rechecks and detail fetches of new profiles are not
+        self.page_budget = page_budget or len(targets) * max_pages * 86400 / base_interval
+
+        now = time.time()
+        self.next_due = {location: now for location in targets}
+        self.last_run = {}
+        self.spent = deque()  # (timestamp, pages)
+        self.depth_history = {location: deque(maxlen=10) for location in targets}
+        self.saturated = {location: True for location in targets}
+        self.rates = {}
+        self.crawls_path = 'data/crawls.json'
+        self.crawls = []  # {"location_id", "start", "end", "new"} for every finished crawl
+        self.load_crawls()
+        self.learn_rates()
+
+        logger.info(f"Adaptive schedule: budget {self.page_budget:.0f} search pages/day, "
+                    f"interval {self.min_interval}-{self.max_interval}s, max depth {self.max_pages} pages")
+
+    @classmethod
+    def from_env(cls, targets, base_interval, max_pages):
+        try:
+            min_interval = int(os.getenv('MIN_CHECK_INTERVAL', '600'))
+            max_interval = int(os.getenv('MAX_CHECK_INTERVAL', str(base_interval * 4)))
+            page_budget = float(os.getenv('PAGE_BUDGET_PER_DAY', '0')) or None
+            history_days = int(os.getenv('RATE_HISTORY_DAYS', '14'))
+        except ValueError as e:
+            logger.warning(f"Invalid adaptive schedule settings: {str(e)}, using defaults")
+            min_interval, max_interval, page_budget, history_days = 600, base_interval * 4, None, 14
+        return cls(targets, base_interval, max_pages, min_interval, max_interval, page_budget, history_days)
+
+    def load_crawls(self):
+        try:
+            if os.path.exists(self.crawls_path):
+                with open(self.crawls_path, 'r', encoding='utf-8') as f:
+                    self.crawls = json.load(f)
+                logger.info(f"Loaded {len(self.crawls)} crawl records")
+        except Exception as e:
+            logger.error(f"Failed to load crawl records: {str(e)}")
+            self.crawls = []
+
+    def save_crawls(self):
+        cutoff = (datetime.now() - timedelta(days=self.history_days)).strftime("%Y-%m-%d %H:%M:%S")
+        self.crawls = [crawl for crawl in self.crawls if crawl["end"] >= cutoff]
+        try:
+            with open(self.crawls_path, 'w', encoding='utf-8') as f:
+                json.dump(self.crawls, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            logger.error(f"Failed to save crawl records: {str(e)}")
+
+    def learn_rates(self):
+        """Estimate new profiles per hour for each (location, hour of day) from crawl records"""
+        cutoff = datetime.now() - timedelta(days=self.history_days)
+
+        for location_id in self.targets.values():
+            crawls = sorted(
+                (crawl for crawl in self.crawls if crawl["location_id"] == location_id),
+                key=lambda crawl: crawl["start"]
+            )
+            counts = [0.0] * 24
+            exposure = [0.0] * 24  # Hours of observation per hour of day
+
+            # A crawl only discovers profiles, they arrived at some point since the previous crawl
+            # of the target, so spread them evenly over that window. The first crawl has no window
+            # and its backlog of existing profiles is not counted as arrivals.
+            for previous, crawl in zip(crawls, crawls[1:]):
+                window_start = datetime.strptime(previous["end"], "%Y-%m-%d %H:%M:%S")
+                window_end = datetime.strptime(crawl["end"], "%Y-%m-%d %H:%M:%S")
+                window = (window_end - window_start).total_seconds()
+                if window_start < cutoff or window <= 0:
+                    continue
+
+                moment = window_start
+                while moment < window_end:
+                    next_hour = moment.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+                    segment = (min(next_hour, window_end) - moment).total_seconds()
+                    counts[moment.hour] += crawl["new"] * segment / window
+                    exposure[moment.hour] += segment / 3600
+                    moment = min(next_hour, window_end)
+
+            # Smooth each hour towards the overall rate with one pseudo-hour of observation
+            observed = sum(exposure)
+            mean = sum(counts) / observed if observed else 0
+            self.rates[location_id] = [(counts[hour] + mean) / (exposure[hour] + 1) for hour in range(24)]
+
+    def rate(self, location, hour):
+        rates = self.rates.get(self.targets[location])
+        if rates and any(rates):
+            return rates[hour]
+        # Nothing learned for this target yet, assume the average of the others (or treat all hours alike)
+        known = [rate for rates in self.rates.values() if any(rates) for rate in rates]
+        return sum(known) / len(known) if known else 1.0
+
+    def interval(self, location, start):
+        """Seconds until next check, crawl frequency proportional to sqrt(arrival rate)"""
+        # Minimising mean discovery delay for a fixed number of crawls gives frequency ~ sqrt(rate)
+        weights = {
+            (target, hour): math.sqrt(self.rate(target, hour))
+            for target in self.targets for hour in range(24)
+        }
+        total_weight = sum(weights.values())
+        if not total_weight:
+            return self.max_interval
+        crawls_per_day = self.page_budget / self.max_pages
+
+        # Walk forward hour by hour until one crawl's worth of frequency has accumulated,
+        # so a quiet hour right before a peak doesn't push the next check past the peak start
+        elapsed = 0
+        due = 1.0
+        moment = start
+        while elapsed < self.max_interval:
+            crawls_per_hour = crawls_per_day * weights[(location, moment.hour)] / total_weight
+            next_hour = moment.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+            segment = min((next_hour - moment).total_seconds(), self.max_interval - elapsed)
+            if crawls_per_hour * segment / 3600 >= due:
+                elapsed += due / crawls_per_hour * 3600
+                break
+            due -= crawls_per_hour * segment / 3600
+            elapsed += segment
+            moment += timedelta(seconds=segment)
+
+        return int(min(max(elapsed, self.min_interval), self.max_interval))
+
+    def depth(self, location, interval):
+        """Pages to crawl so profiles that arrived during the interval are still reached"""
+        history = self.depth_history[location]
+        if self.saturated[location] or not history:
+            return self.max_pages
+        pages_per_second = max(history)
+        return min(max(math.ceil(pages_per_second * interval) + 1, 1), self.max_pages)
+
+    def spent_today(self, now):
+        while self.spent and self.spent[0][0] < now - 86400:
+            self.spent.popleft()
+        return sum(pages for _, pages in self.spent)
+
+    def next_run(self):
+        """Return (location, pages, seconds to wait) for the next due target"""
+        now = time.time()
+        location = min(self.next_due, key=self.next_due.get)
+        wait = max(self.next_due[location] - now, 0)
+        interval = now + wait - self.last_run[location] if location in self.last_run else self.max_interval
+        pages = self.depth(location, interval)
+
+        # Hold off until enough of the last 24h budget expires to afford this crawl
+        spent = self.spent_today(now)
+        for timestamp, amount in self.spent:
+            if spent + pages <= self.page_budget:
+                break
+            spent -= amount
+            wait = max(wait, timestamp + 86400 - now)
+
+        return location, pages, wait
+
+    def record_cycle(self, location, started, pages, deepest_new_page, new_count):
+        now = time.time()
+        self.spent.append((now, pages))
+
+        self.crawls.append({
+            "location_id": self.targets[location],
+            "start": started.strftime("%Y-%m-%d %H:%M:%S"),
+            "end": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "new": new_count
+        })
+        self.save_crawls()
+        self.learn_rates()
+
+        if location in self.last_run:
+            elapsed = max(now - self.last_run[location], 1)
+            self.depth_history[location].append(deepest_new_page / elapsed)
+        # New profiles on the last crawled page may continue further down, next crawl goes full depth
+        self.saturated[location] = deepest_new_page >= pages
+        self.last_run[location] = now
+
+        hour = datetime.now().hour
+        interval = self.interval(location, datetime.now())
+        self.next_due[location] = now + interval
+        logger.info(f"Next check of {location} in {interval}s "
+                    f"(rate {self.rate(location, hour):.2f}/h at {hour}:00, "
+                    f"spent {self.spent_today(now)}/{self.page_budget:.0f} pages in 24h)")
@@ -0,0 +1,157 @@
+import os
+import json
+import time
+import logging
+import inspect
+from functools import wraps
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+class Tracer:
+    """Records nested spans and dumps them as Chrome trace files (also readable by speedscope)"""
+
+    def __init__(self, enabled=False, trace_dir='data/traces', top_n=10, keep=100):
+        self.enabled = enabled
+        self.trace_dir = trace_dir
+        self.top_n = top_n
+        self.keep = keep  # Trace files to retain, 0 keeps all
+        self.events = []
+        self.pid = os.getpid()
+        self._noop = nullcontext()
+
+        if self.enabled:
+            os.makedirs(self.trace_dir, exist_ok=True)
+            logger.info(f"Tracing enabled, writing traces to {self.trace_dir}")
+
+    @classmethod
+    def from_env(cls):
+        enabled = os.getenv('TRACE_ENABLED', '').lower() in ('1', 'true', 'yes')
+        trace_dir = os.getenv('TRACE_DIR', 'data/traces')
+        try:
+            top_n = int(os.getenv('TRACE_TOP_N', '10'))
+        except ValueError:
+            logger.warning(f"Invalid TRACE_TOP_N: {os.getenv('TRACE_TOP_N')}, using default 10")
+            top_n = 10
+        try:
+            keep = int(os.getenv('TRACE_KEEP', '100'))
+        except ValueError:
+            logger.warning(f"Invalid TRACE_KEEP: {os.getenv('TRACE_KEEP')}, using default 100")
+            keep = 100
+        return cls(enabled=enabled, trace_dir=trace_dir, top_n=top_n, keep=keep)
+
+    def span(self, name, **args):
+        # Shared no-op context keeps overhead to a single attribute check when disabled
+        if not self.enabled:
+            return self._noop
+        return self._span(name, args)
+
+    def traced(self, name, *arg_names):
+        """Decorator recording every call as a span, with the named arguments as span args"""
+        def decorator(func):
+            signature = inspect.signature(func)
+
+            def span_args(args, kwargs):
+                bound = signature.bind(*args, **kwargs)
+                return {arg: bound.arguments.get(arg) for arg in arg_names}
+
+            if inspect.iscoroutinefunction(func):
+                @wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    if not self.enabled:
+                        return await func(*args, **kwargs)
+                    with self._span(name, span_args(args, kwargs)):
+                        return await func(*args, **kwargs)
+                return async_wrapper
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with self._span(name, span_args(args, kwargs)):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @contextmanager
+    def _span(self, name, args):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.events.append({
+                "name": name,
+                "cat": name,
+                "ph": "X",
+                "ts": start * 1e6,
+                "dur": (end - start) * 1e6,
+                "pid": self.pid,
+                "tid": 1,
+                "args": {key: str(value) for key, value in args.items()}
+            })
+
+    def finish_cycle(self):
+        """Dump collected spans to a trace file, log slowest operations and reset"""
+        if not self.enabled or not self.events:
+            return None
+
+        path = os.path.join(self.trace_dir, f"trace_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+            logger.info(f"Saved {len(self.events)} trace events to {path}")
+        except Exception as e:
+            logger.error(f"Failed to save trace: {str(e)}")
+            path = None
+
+        self.log_summary()
+        self.events = []
+        self.cleanup()
+        return path
+
+    def cleanup(self):
+        """Keep only the newest keep trace files"""
+        if not self.keep:
+            return
+        try:
+            traces = sorted(name for name in os.listdir(self.trace_dir)
+                            if name.startswith('trace_') and name.endswith('.json'))
+            for name in traces[:-self.keep]:
+                os.remove(os.path.join(self.trace_dir, name))
+        except Exception as e:
+            logger.error(f"Failed to clean up old traces: {str(e)}")
+
+    def self_times(self):
+        """Duration of each event minus the time spent in its direct children"""
+        self_times = {id(event): event["dur"] for event in self.events}
+        stack = []
+        for event in sorted(self.events, key=lambda event: (event["ts"], -event["dur"])):
+            while stack and stack[-1]["ts"] + stack[-1]["dur"] <= event["ts"]:
+                stack.pop()
+            if stack:
+                self_times[id(stack[-1])] -= event["dur"]
+            stack.append(event)
+        return self_times
+
+    def log_summary(self):
+        self_times = self.self_times()
+        totals = {}
+        for event in self.events:
+            total, count = totals.get(event["cat"], (0.0, 0))
+            totals[event["cat"]] = (total + self_times[id(event)], count + 1)
+
+        logger.info("Trace self time by stage: " + ", ".join(
+            f"{cat} {total / 1e6:.2f}s/{count}" for cat, (total, count) in
+            sorted(totals.items(), key=lambda item: item[1][0], reverse=True)
+        ))
+
+        slowest = sorted(self.events, key=lambda event: self_times[id(event)], reverse=True)[:self.top_n]
+        logger.info(f"Top {len(slowest)} slowest operations (self / total):")
+        for event in slowest:
+            details = " ".join(f"{key}={value}" for key, value in event["args"].items())
+            logger.info(f"  {self_times[id(event)] / 1e6:8.2f}s / {event['dur'] / 1e6:8.2f}s  "
+                        f"{event['name']} {details}".rstrip())
+
+tracer = Tracer.from_env()